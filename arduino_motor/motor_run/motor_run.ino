@@ -4,6 +4,9 @@
   Input can be positive or negative integers. The sign of the integer determines direction of movement. 
   The number of steps is provided via serial communication. This can be done via Arduino
   terminal or using the python script provided in zivid_turntable.
+  Alternatively, the motor can rotate continuously: input "S<speed>" sets a constant speed in
+  steps per second ("S0" stops), and while rotating the position is streamed back as lines
+  "P<millis> <steps>". Every command is terminated by a newline.
   Hardware required: arduino uno and motorshield rev3*/
 
 // Include the AccelStepper and serial library:
@@ -46,24 +49,46 @@ void setup() {
 }
 
 
+// Interval between streamed positions in milliseconds:
+const unsigned long reportIntervalMs = 50;
+
+bool continuous = false;
+unsigned long lastReport = 0;
+
+
 void loop() {
-  //sets steps to zero, will not move from current position before user input
-  int steps = 0; 
-  //Wait for user input of integer amount of steps to move
-  while(true){
-    if(Serial.available() > 0){
-      String input = Serial.readString();
-      steps = input.toInt();
-      break;
+  //Check for user input of integer amount of steps to move, or a speed command
+  if(Serial.available() > 0){
+    String input = Serial.readStringUntil('\n');
+    if(input.startsWith("S")){
+      float speed = input.substring(1).toFloat();
+      continuous = (speed != 0);
+      stepper.setSpeed(speed);
+      lastReport = millis() - reportIntervalMs;
+    }
+    else{
+      int steps = input.toInt();
+      //Sets relative movement in regards to current position
+      stepper.move(steps);
+      // Run to position with set speed and acceleration:
+      stepper.runToPosition();
+      delay(100);
+      while(stepper.isRunning()){
+        delay(10);  
+      }
+      Serial.write(1);
     }
   }
-  //Sets relative movement in regards to current position
-  stepper.move(steps);
-  // Run to position with set speed and acceleration:
-  stepper.runToPosition();
-  delay(100);
-  while(stepper.isRunning()){
-    delay(10);  
+  //Step at constant speed and stream timestamped position
+  if(continuous){
+    stepper.runSpeed();
+    unsigned long now = millis();
+    if(now - lastReport >= reportIntervalMs){
+      lastReport = now;
+      Serial.print("P");
+      Serial.print(now);
+      Serial.print(" ");
+      Serial.println(stepper.currentPosition());
+    }
   }
-  Serial.write(1);
 }
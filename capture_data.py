@@ -7,15 +7,50 @@ Run this if the USB access is denied:
 import argparse
 
 import zivid
-from zivid_turntable.capture import auto_capture
+from zivid_turntable.capture import (
+    auto_capture,
+    adaptive_capture,
+    continuous_capture,
+)
 
 
 def _main() -> None:
 
     # Get args
     parser = argparse.ArgumentParser(description="Capture turntable data")
-    parser.add_argument("images", type=int, help="number of images")
+    parser.add_argument(
+        "images", type=int, help="number of images (maximum if --adaptive)"
+    )
     parser.add_argument("--label", type=str, help="label for dataset")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="choose rotations from coverage and stop when the object is covered",
+    )
+    parser.add_argument(
+        "--min-gain",
+        type=float,
+        default=0.05,
+        help="coverage gain per largest move below which adaptive capture stops",
+    )
+    mode.add_argument(
+        "--continuous",
+        action="store_true",
+        help="capture while the turntable rotates at constant speed",
+    )
+    parser.add_argument(
+        "--seconds-per-rev",
+        type=float,
+        default=60.0,
+        help="time for one revolution in continuous mode",
+    )
+    parser.add_argument(
+        "--capture-budget",
+        type=float,
+        default=1.2,
+        help="time-budget per capture in seconds (keep short in continuous mode)",
+    )
     args = parser.parse_args()
     print(args)
 
@@ -24,9 +59,29 @@ def _main() -> None:
     cam = app.connect_camera()
 
     # Start capture loop
-    auto_capture(
-        label=args.label, camera=cam, n_images=args.images, capture_budget_seconds=1.2
-    )
+    if args.continuous:
+        continuous_capture(
+            label=args.label,
+            camera=cam,
+            n_images=args.images,
+            capture_budget_seconds=args.capture_budget,
+            seconds_per_rev=args.seconds_per_rev,
+        )
+    elif args.adaptive:
+        adaptive_capture(
+            label=args.label,
+            camera=cam,
+            capture_budget_seconds=args.capture_budget,
+            max_images=args.images,
+            min_gain=args.min_gain,
+        )
+    else:
+        auto_capture(
+            label=args.label,
+            camera=cam,
+            n_images=args.images,
+            capture_budget_seconds=args.capture_budget,
+        )
 
 
 if __name__ == "__main__":
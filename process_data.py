@@ -5,8 +5,10 @@ from pathlib import Path
 
 import zivid
 import open3d as o3d
-from zivid_turntable.io import make_casedir_name
-from zivid_turntable.calibration import get_transforms
+from zivid_turntable.io import make_casedir_name, FrameSource
+from zivid_turntable.calibration import get_transforms_from_markers
+from zivid_turntable.featurepoints import find_aruco_markers
+from zivid_turntable.prescan import prescan
 from zivid_turntable.processing import (
     frame_to_open3d_pointcloud,
     remove_divergent_normals,
@@ -14,6 +16,7 @@ from zivid_turntable.processing import (
     clean_outlier_blobs,
     adjust_colors_from_normals,
 )
+from zivid_turntable.refinement import refine_alignment
 from zivid_turntable.stitching import stitch
 
 
@@ -27,24 +30,59 @@ def _main() -> None:
         action="store_true",
         help="equalize histogram when detecting markers",
     )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="only run the quick pre-scan of markers in each frame",
+    )
+    parser.add_argument(
+        "--refine",
+        action="store_true",
+        help="refine marker-based alignment with multi-scale ICP",
+    )
     args = parser.parse_args()
     print(args)
 
-    # Load frames from directory
+    # Find frames in directory
     label = args.label
     datadir = Path(".") / make_casedir_name(label)
     print(f"Loading frames from {datadir}")
     _ = zivid.Application()
-    frames = [zivid.Frame(filepath) for filepath in datadir.glob("*.zdf")]
-    print(f"Loaded {len(frames)} frames")
+    frame_source = FrameSource(datadir)
+    print(f"Found {len(frame_source)} frames")
+
+    # Pre-scan to warn about bad frames before heavy processing
+    print("Pre-scanning frames")
+    checks = prescan(frame_source, equalize_histogram=args.eq_hist)
+    if args.check:
+        return
+    flagged = [check.index for check in checks if not check.keep]
+    if flagged:
+        print(
+            f"Warning: frames {flagged} may have to be dropped. "
+            "Checking them at full resolution."
+        )
+
+    # Detect markers and convert to Open3D, while the next frame is being read
+    print("Detecting markers and converting to Open3D PointCloud for each frame")
+    marker_sets = []
+    point_cloud_originals = []
+    frame_indices = []
+    for info, frame in frame_source.frames():
+        print(f"Processing {info.path.name}")
+        frame_indices.append(info.index)
+        marker_sets.append(find_aruco_markers(frame.point_cloud(), args.eq_hist))
+        point_cloud_originals.append(frame_to_open3d_pointcloud(frame))
+        frame.release()
 
     # Get transforms
-    print("Detecting markers and calculating transforms for each frame")
-    transforms = get_transforms(frames, equalize_hist=args.eq_hist)
+    print("Calculating transforms for each frame")
+    transforms = get_transforms_from_markers(marker_sets, frame_indices)
 
-    # Convert to Open3D
-    print("Converting to Open3D PointCloud")
-    point_cloud_originals = [frame_to_open3d_pointcloud(frame) for frame in frames]
+    # Drop frames that could not be registered
+    kept = [i for i, transform in enumerate(transforms) if transform is not None]
+    point_cloud_originals = [point_cloud_originals[i] for i in kept]
+    transforms = [transforms[i] for i in kept]
 
     # Preprocessing
     print("Filtering based on normals")
@@ -69,6 +107,13 @@ def _main() -> None:
     print("Removing outliers from every point cloud")
     point_clouds = [clean_outlier_blobs(pcd) for pcd in point_clouds]
 
+    # Refinement
+    if args.refine:
+        print("Refining alignment with multi-scale ICP")
+        corrections = refine_alignment(point_clouds)
+        for pcd, correction in zip(point_clouds, corrections):
+            pcd.transform(correction)
+
     # Stitching
     print("Stitching/combining point clouds")
     pcd = stitch(point_clouds)
@@ -1,12 +1,60 @@
 """Modules that make shit work"""
 
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
 import serial.tools.list_ports
 
 
+@dataclass
+class StepSample:
+    """Class for representing a motor position streamed during continuous rotation"""
+
+    millis: int
+    steps: int
+    host_time: float
+
+
+def _fit_firmware_clock(
+    firmware_times: np.ndarray, host_times: np.ndarray, n_bins: int = 10
+) -> np.ndarray:
+    """Map firmware time to host time, allowing for offset and clock drift
+
+    Each sample arrives at the host some varying delay after it was sent, so the
+    lowest host-firmware difference in each time bin is taken as the lower
+    envelope, and a line is fitted through these.
+
+    Arguments:
+        firmware_times: Array (n) of firmware timestamps in seconds (increasing)
+        host_times:     Array (n) of host receive times in seconds
+        n_bins:         Number of time bins to take the lower envelope in
+    Returns:
+        Array (n) of firmware timestamps mapped to host time
+    """
+    differences = host_times - firmware_times
+    bins = np.linspace(firmware_times[0], firmware_times[-1], n_bins + 1)
+    bin_numbers = np.clip(np.digitize(firmware_times, bins) - 1, 0, n_bins - 1)
+    envelope_times = []
+    envelope_differences = []
+    for bin_number in np.unique(bin_numbers):
+        in_bin = np.nonzero(bin_numbers == bin_number)[0]
+        lowest = in_bin[np.argmin(differences[in_bin])]
+        envelope_times.append(firmware_times[lowest])
+        envelope_differences.append(differences[lowest])
+    if len(envelope_times) < 2:
+        return firmware_times + np.min(differences)
+    skew, offset = np.polyfit(envelope_times, envelope_differences, 1)
+    return firmware_times + offset + skew * firmware_times
+
+
 class ArduinoCom:
     """Class to handle communications and info on motor control
     -Sets serial port communications
     -Sets relative number of steps to move to from current position
+    -Starts and stops continuous rotation, and tracks the streamed position
     -Returns: steps per a revolution, and degrees per step
     """
 
@@ -29,6 +77,10 @@ class ArduinoCom:
         print(use_port)
         serial_uno = serial.Serial(use_port, 9600)
         self.serial_connect = serial_uno
+        self._samples: List[StepSample] = []
+        self._samples_lock = threading.Lock()
+        self._reader: Optional[threading.Thread] = None
+        self._stop_reader = threading.Event()
 
     def get_degrees_per_step(self) -> float:
         """Returns degrees per a step of the motor"""
@@ -40,6 +92,70 @@ class ArduinoCom:
 
     def move_steps(self, steps: int) -> None:
         """Send number of steps to move to the arduino"""
-        steps_b = str(steps).encode()
+        steps_b = f"{steps}\n".encode()
         self.serial_connect.write(steps_b)
         self.serial_connect.read()
+
+    def start_rotation(self, steps_per_second: float) -> None:
+        """Start rotating at constant speed and record the streamed position"""
+        with self._samples_lock:
+            self._samples = []
+        self._stop_reader.clear()
+        self.serial_connect.timeout = 0.5
+        self._reader = threading.Thread(target=self._read_samples, daemon=True)
+        self._reader.start()
+        self.serial_connect.write(f"S{steps_per_second}\n".encode())
+
+    def stop_rotation(self) -> None:
+        """Stop continuous rotation and discard any remaining streamed positions"""
+        self.serial_connect.write(b"S0\n")
+        self._stop_reader.set()
+        if self._reader is not None:
+            self._reader.join()
+            self._reader = None
+        time.sleep(0.1)
+        self.serial_connect.reset_input_buffer()
+        self.serial_connect.timeout = None
+
+    def _read_samples(self) -> None:
+        """Read streamed positions until stopped (runs in a background thread)"""
+        while not self._stop_reader.is_set():
+            line = self.serial_connect.readline()
+            host_time = time.monotonic()
+            if not line.startswith(b"P"):
+                continue
+            try:
+                millis, steps = line[1:].split()
+                sample = StepSample(int(millis), int(steps), host_time)
+            except ValueError:
+                continue
+            with self._samples_lock:
+                self._samples.append(sample)
+
+    def get_angle_at(self, host_time: float) -> float:
+        """Get interpolated turntable angle at a given time during continuous rotation
+
+        Arguments:
+            host_time:  Time given by time.monotonic()
+        Returns:
+            Turntable angle in degrees, relative to the firmware start position
+        """
+        with self._samples_lock:
+            samples = list(self._samples)
+        if len(samples) < 2:
+            raise RuntimeError(
+                f"Received only {len(samples)} motor positions. "
+                "At least 2 are required to interpolate the angle."
+            )
+
+        firmware_times = np.array([sample.millis for sample in samples]) / 1000.0
+        steps = np.array([sample.steps for sample in samples], dtype=float)
+        host_times = np.array([sample.host_time for sample in samples])
+        times = _fit_firmware_clock(firmware_times, host_times)
+
+        if host_time > times[-1]:
+            slope = (steps[-1] - steps[-2]) / (times[-1] - times[-2])
+            position = steps[-1] + slope * (host_time - times[-1])
+        else:
+            position = np.interp(host_time, times, steps)
+        return float(position * self.degrees)
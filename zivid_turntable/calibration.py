@@ -1,6 +1,6 @@
 """Module for finding transforms between captures"""
 
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional, Set
 
 import numpy as np
 import zivid
@@ -109,54 +109,134 @@ def _get_base_transform(marker_set: Dict[int, ArucoMarker]) -> np.ndarray:
     return transform
 
 
+def plan_registration(
+    marker_ids: List[Set[int]],
+    min_markers: int = 4,
+    min_common: int = 3,
+    frame_indices: Optional[List[int]] = None,
+    verbose: bool = True,
+) -> Dict[int, Optional[int]]:
+    """Choose which earlier frame each frame is registered to
+
+    Frames with too few markers are dropped. Every other frame is registered to
+    the nearest earlier kept frame that shares enough markers with it, bridging
+    over dropped frames. Frames without such an earlier frame are dropped too.
+
+    Arguments:
+        marker_ids:     List of detected marker IDs for each frame, in order
+        min_markers:    Minimum number of markers in a kept frame
+        min_common:     Minimum number of markers shared with the reference frame
+        frame_indices:  Frame index (as in frame_NN.zdf) of each frame, for logging
+        verbose:        Log dropped and bridged frames
+    Returns:
+        Dictionary of {kept frame: reference frame}, with None for the first frame,
+        both given as positions in marker_ids
+    """
+    if frame_indices is None:
+        frame_indices = list(range(len(marker_ids)))
+    plan: Dict[int, Optional[int]] = {}
+    for i, ids in enumerate(marker_ids):
+        n_markers = len(ids)
+        if n_markers < min_markers:
+            if verbose:
+                print(
+                    f"Dropping frame {frame_indices[i]}: contains only {n_markers} well "
+                    f"resolved markers. At least {min_markers} is required."
+                )
+            continue
+        if not plan:
+            plan[i] = None
+            continue
+        references = [
+            j
+            for j in sorted(plan, reverse=True)
+            if len(ids & marker_ids[j]) >= min_common
+        ]
+        if not references:
+            if verbose:
+                print(
+                    f"Dropping frame {frame_indices[i]}: shares less than {min_common} "
+                    "markers with every earlier frame"
+                )
+            continue
+        if verbose and references[0] != i - 1:
+            print(
+                f"Bridging frame {frame_indices[i]} to frame "
+                f"{frame_indices[references[0]]}"
+            )
+        plan[i] = references[0]
+    return plan
+
+
 def get_transforms(
     frames: List[zivid.Frame], equalize_hist: bool = False
-) -> List[np.ndarray]:
+) -> List[Optional[np.ndarray]]:
     """Get transforms to bring each frame into the base-plate frame
 
     Arguments:
         frames:     List of Zivid frames
     Returns:
-        List of 4x4 transforms
+        List of 4x4 transforms (None for frames that were dropped)
     """
 
     # Find and identify all Aruco markers
     marker_sets = [
         find_aruco_markers(frame.point_cloud(), equalize_hist) for frame in frames
     ]
+    return get_transforms_from_markers(marker_sets)
+
+
+def get_transforms_from_markers(
+    marker_sets: List[Dict[int, ArucoMarker]],
+    frame_indices: Optional[List[int]] = None,
+) -> List[Optional[np.ndarray]]:
+    """Get transforms to bring each frame into the base-plate frame
+
+    Arguments:
+        marker_sets:    List of detected Aruco markers for each frame, in order
+        frame_indices:  Frame index (as in frame_NN.zdf) of each frame, for logging
+    Returns:
+        List of 4x4 transforms (None for frames that were dropped)
+    """
+
+    if frame_indices is None:
+        frame_indices = list(range(len(marker_sets)))
 
     print("Detected Aruco marker sets:")
-    for i, marker_set in enumerate(marker_sets):
-        print(f"Frame {i}:")
+    for frame_index, marker_set in zip(frame_indices, marker_sets):
+        print(f"Frame {frame_index}:")
         for key, val in marker_set.items():
             print(f"{key}: {val.center3d}")
 
-    # Check quality of marker sets
-    for i, marker_set in enumerate(marker_sets):
-        n_markers = len(marker_set.keys())
-        min_markers = 4
-        if n_markers < min_markers:
-            raise RuntimeError(
-                f"Frame {i} contains only {n_markers} well resolved markers. "
-                f"At least {min_markers} is required."
-            )
+    # Check quality of marker sets, and choose which frame to register each to
+    plan = plan_registration(
+        [set(marker_set.keys()) for marker_set in marker_sets],
+        frame_indices=frame_indices,
+    )
+    if not plan:
+        raise RuntimeError("No frame contains enough well resolved markers.")
 
     # Get transform for transforming to base-plate
-    base_transform = np.linalg.inv(_get_base_transform(marker_sets[0]))
+    first = min(plan.keys())
+    base_transform = np.linalg.inv(_get_base_transform(marker_sets[first]))
 
     # Use markers to transform all frames into the coordinate system of the base
     print("-" * 70)
     print("Calculating transforms...")
 
-    transforms = []
-    transform_to_maincam = np.eye(4)
-    for i in range(len(frames)):
-
-        if i > 0:
-            transform_to_prev = _get_transform(marker_sets[i - 1], marker_sets[i])
-            transform_to_maincam = transform_to_maincam.dot(transform_to_prev)
-
-        transform = np.dot(base_transform, transform_to_maincam)
+    transforms_to_maincam = {}
+    for i, reference in plan.items():
+        if reference is None:
+            transforms_to_maincam[i] = np.eye(4)
+        else:
+            transform_to_reference = _get_transform(
+                marker_sets[reference], marker_sets[i]
+            )
+            transforms_to_maincam[i] = transforms_to_maincam[reference].dot(
+                transform_to_reference
+            )
 
-        transforms.append(transform)
+    transforms: List[Optional[np.ndarray]] = [None] * len(marker_sets)
+    for i, transform_to_maincam in transforms_to_maincam.items():
+        transforms[i] = np.dot(base_transform, transform_to_maincam)
     return transforms
@@ -1,14 +1,95 @@
 """Module for capturing point clouds"""
 
+import threading
 import time
 from datetime import timedelta
 import itertools
 from pathlib import Path
+from queue import Queue
+from typing import List, Optional, Tuple
 
 import zivid
 
-from .io import create_casedir
+from .io import create_casedir, write_frame_angles, write_thumbnail
 from .arduino_com import ArduinoCom
+from .coverage import CoverageEstimator
+from .featurepoints import make_thumbnail
+
+
+def _acquisition_midpoint(frame: zivid.Frame, before: float, after: float) -> float:
+    """Estimate the midpoint of the acquisition of a frame
+
+    Capture returns once acquisition is done, while processing continues in the
+    background. Acquisition starts at the frame time stamp, so settings upload
+    and other latency before it is left out. The time stamp is in wall-clock
+    time and is clamped to the capture call, in case the clocks disagree.
+
+    Arguments:
+        frame:  Zivid frame that was just captured
+        before: Time given by time.monotonic() before capture was called
+        after:  Time given by time.monotonic() when capture returned
+    Returns:
+        Estimated acquisition midpoint, as time.monotonic() time
+    """
+    wall_clock_offset = time.time() - time.monotonic()
+    start = frame.info.time_stamp.timestamp() - wall_clock_offset
+    start = min(max(start, before), after)
+    return (start + after) / 2
+
+
+def _save_frame(frame: zivid.Frame, filepath: Path) -> None:
+    """Save frame, and a thumbnail next to it for quick pre-scans
+
+    Arguments:
+        frame:      Zivid frame to save
+        filepath:   Path to save frame to
+    """
+    frame.save(filepath)
+    write_thumbnail(filepath, make_thumbnail(frame.point_cloud()))
+
+
+class _BackgroundSaver:
+    """Save frames in a background thread, releasing each frame when done"""
+
+    def __init__(self) -> None:
+        self._queue: "Queue[Optional[Tuple[zivid.Frame, Path]]]" = Queue()
+        self._errors: List[Exception] = []
+        self._thread = threading.Thread(target=self._save_frames, daemon=True)
+        self._thread.start()
+
+    def _save_frames(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            frame, filepath = item
+            try:
+                if not self._errors:
+                    _save_frame(frame, filepath)
+            except Exception as ex:  # pylint: disable=broad-except
+                self._errors.append(ex)
+            finally:
+                frame.release()
+
+    def save(self, frame: zivid.Frame, filepath: Path) -> None:
+        """Queue frame for saving. The saver takes ownership of the frame.
+
+        Arguments:
+            frame:      Zivid frame to save
+            filepath:   Path to save frame to
+        """
+        self._queue.put((frame, filepath))
+
+    def close(self) -> None:
+        """Wait for all queued frames to be saved
+
+        Raises the first error that occurred while saving, if any.
+        """
+        print(f"Waiting for {self._queue.qsize()} frames to be saved")
+        self._queue.put(None)
+        self._thread.join()
+        if self._errors:
+            raise self._errors[0]
 
 
 def get_settings(camera: zivid.Camera, capture_budget_seconds: float) -> zivid.Settings:
@@ -74,7 +155,7 @@ def manual_capture_loop(
         filename = f"frame_{i:02d}.zdf"
         print(f"Capturing frame: {filename}")
         with camera.capture(settings) as frame:
-            frame.save(dirpath / filename)
+            _save_frame(frame, dirpath / filename)
 
 
 def auto_capture(
@@ -104,19 +185,211 @@ def auto_capture(
     # Connect to motor
     motor_controller = ArduinoCom()
     steps_per_rev = motor_controller.get_steps_per_rev()
-    steps_per_move = int(steps_per_rev / n_images)
+    degrees_per_step = motor_controller.get_degrees_per_step()
     time.sleep(1)
 
+    angles = {}
     for i in range(n_images):
 
         filename = f"frame_{i:02d}.zdf"
         print(f"Capturing frame: {filename}")
         with camera.capture(settings) as frame:
             if label is not None:
-                frame.save(dirpath / filename)
+                _save_frame(frame, dirpath / filename)
+        angles[filename] = round(i * steps_per_rev / n_images) * degrees_per_step
 
+        # Round each target position rather than each move, so that the
+        # moves add up to a full revolution
+        steps_per_move = round((i + 1) * steps_per_rev / n_images) - round(
+            i * steps_per_rev / n_images
+        )
         print(f"Sending move signal: {steps_per_move}")
         time.sleep(0.1)
         motor_controller.move_steps(steps_per_move)
         time.sleep(0.1)
         print("Move done")
+
+    if label is not None:
+        write_frame_angles(dirpath, angles)
+
+
+def adaptive_capture(  # pylint: disable=too-many-arguments,too-many-locals
+    label: str,
+    camera: zivid.Camera,
+    capture_budget_seconds: float,
+    max_images: int = 36,
+    min_gain: float = 0.05,
+    max_step_degrees: float = 45.0,
+    voxel_size: float = 2.0,
+    workdir: Path = Path("."),
+) -> None:
+    """Auto-capture with turntable until the object is covered
+
+    The turntable only rotates forwards, so that neighboring frames share markers.
+    After each frame, the next move is the largest one that does not skip past
+    surface about to come into view (see CoverageEstimator.choose_next_view).
+    Capture stops when a frame adds too little new coverage for the rotation made,
+    or when a full revolution has been made. The turntable angle of each frame is
+    measured from the markers shared with the previous frame where possible.
+
+    Arguments:
+        label:                  Label to store data with (set None for dry-run)
+        camera:                 Zivid camera to capture with
+        capture_budget_seconds: Time-budget per capture
+        max_images:             Maximum number of images to capture
+        min_gain:               Stop when less than this fraction of the occupied
+                                voxels in a frame are new, scaled to a rotation of
+                                max_step_degrees
+        max_step_degrees:       Largest rotation between two frames
+        voxel_size:             Size of voxels used for the coverage estimate
+        workdir                 Path to root directory to create case in
+    """
+
+    # Create case directory
+    if label is not None:
+        dirpath = create_casedir(label, workdir)
+
+    # Get settings
+    settings = get_settings(camera, capture_budget_seconds)
+
+    # Connect to motor
+    motor_controller = ArduinoCom()
+    steps_per_rev = motor_controller.get_steps_per_rev()
+    degrees_per_step = motor_controller.get_degrees_per_step()
+    min_steps = max(1, round(steps_per_rev / max_images))
+    max_steps = max(min_steps, int(max_step_degrees / degrees_per_step))
+    time.sleep(1)
+
+    estimator: Optional[CoverageEstimator] = None
+    position = 0
+    steps_per_move = max_steps
+    angles = {}
+    for i in range(max_images):
+
+        filename = f"frame_{i:02d}.zdf"
+        print(f"Capturing frame: {filename}")
+        with camera.capture(settings) as frame:
+            if label is not None:
+                _save_frame(frame, dirpath / filename)
+            if estimator is None:
+                estimator = CoverageEstimator.from_point_cloud(
+                    frame.point_cloud(), voxel_size=voxel_size
+                )
+            gain = estimator.add_view(frame.point_cloud(), position * degrees_per_step)
+        angles[filename] = estimator.angle
+        print(f"Coverage gain: {gain:.3f} ({estimator.n_voxels} voxels)")
+
+        # Small moves give small gains even when much remains to be seen
+        if i > 0 and gain * max_steps / steps_per_move < min_gain:
+            print(f"Coverage gain below {min_gain} per largest move, stopping")
+            break
+
+        # Leave room for at least a minimal move back to the first frame
+        candidates = list(
+            range(min_steps, min(max_steps, steps_per_rev - position - min_steps) + 1)
+        )
+        if not candidates:
+            print("Full revolution captured, stopping")
+            break
+        candidate_angles = [
+            estimator.predict_angle((position + steps) * degrees_per_step)
+            for steps in candidates
+        ]
+        steps_per_move = candidates[estimator.choose_next_view(candidate_angles)]
+
+        print(f"Sending move signal: {steps_per_move}")
+        time.sleep(0.1)
+        motor_controller.move_steps(steps_per_move)
+        position += steps_per_move
+        time.sleep(0.1)
+        print("Move done")
+
+    if label is not None:
+        write_frame_angles(dirpath, angles)
+
+
+def continuous_capture(  # pylint: disable=too-many-arguments,too-many-locals
+    label: str,
+    camera: zivid.Camera,
+    n_images: int,
+    capture_budget_seconds: float,
+    seconds_per_rev: float,
+    workdir: Path = Path("."),
+) -> None:
+    """Auto-capture while the turntable rotates at constant speed
+
+    Frames are captured at fixed intervals over one revolution, and each frame is
+    tagged with the turntable angle interpolated at the estimated midpoint of its
+    acquisition (see _acquisition_midpoint). Frames are saved in a background
+    thread, so that saving does not delay the capture schedule.
+    Use a short capture budget to keep motion blur acceptable.
+
+    Arguments:
+        label:                  Label to store data with (set None for dry-run)
+        camera:                 Zivid camera to capture with
+        n_images:               Number of images to capture
+        capture_budget_seconds: Time-budget per capture
+        seconds_per_rev:        Time for one revolution of the turntable
+        workdir                 Path to root directory to create case in
+    """
+
+    if n_images < 1:
+        raise RuntimeError(f"Number of images must be positive, got {n_images}")
+
+    # Create case directory
+    if label is not None:
+        dirpath = create_casedir(label, workdir)
+
+    # Get settings
+    settings = get_settings(camera, capture_budget_seconds)
+
+    # Connect to motor
+    motor_controller = ArduinoCom()
+    steps_per_rev = motor_controller.get_steps_per_rev()
+    interval = seconds_per_rev / n_images
+    time.sleep(1)
+
+    print(f"Starting rotation: {steps_per_rev / seconds_per_rev} steps per second")
+    motor_controller.start_rotation(steps_per_rev / seconds_per_rev)
+    midpoints = {}
+    saver = _BackgroundSaver()
+    try:
+        start = time.monotonic() + interval
+        for i in range(n_images):
+
+            delay = start + i * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                print(f"Capture is lagging {-delay:.2f} seconds behind schedule")
+
+            filename = f"frame_{i:02d}.zdf"
+            print(f"Capturing frame: {filename}")
+            before = time.monotonic()
+            frame = camera.capture(settings)
+            after = time.monotonic()
+            midpoints[filename] = _acquisition_midpoint(frame, before, after)
+            if label is not None:
+                saver.save(frame, dirpath / filename)
+            else:
+                frame.release()
+
+        # Make sure positions have been streamed past the last acquisition
+        time.sleep(0.2)
+        angles = {
+            filename: motor_controller.get_angle_at(midpoint)
+            for filename, midpoint in midpoints.items()
+        }
+    finally:
+        motor_controller.stop_rotation()
+        print("Rotation stopped")
+        saver.close()
+
+    # Make angles relative to the first frame
+    first_angle = angles[min(angles.keys())]
+    angles = {filename: angle - first_angle for filename, angle in angles.items()}
+    for filename, angle in sorted(angles.items()):
+        print(f"{filename}: {angle:.2f} degrees")
+
+    if label is not None:
+        write_frame_angles(dirpath, angles)
@@ -0,0 +1,414 @@
+"""Module for estimating how much of the object has been covered during capture"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import zivid
+
+from .calibration import plane_fit_svd
+from .featurepoints import ArucoMarker, find_aruco_markers
+
+_UNKNOWN = 0
+_FREE = 1
+_OCCUPIED = 2
+
+
+def _wrap_degrees(angle: np.ndarray) -> np.ndarray:
+    """Wrap angles to the interval [-180, 180)
+
+    Arguments:
+        angle:  Angle(s) in degrees
+    Returns:
+        Wrapped angle(s) in degrees
+    """
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def _rotation_matrix(angle: float) -> np.ndarray:
+    """Get matrix that rotates back by a turntable angle
+
+    Arguments:
+        angle:  Turntable angle in degrees
+    Returns:
+        Array (3x3) rotating by -angle about the z-axis
+    """
+    cos_a = np.cos(np.radians(angle))
+    sin_a = np.sin(np.radians(angle))
+    return np.array([[cos_a, sin_a, 0.0], [-sin_a, cos_a, 0.0], [0.0, 0.0, 1.0]])
+
+
+class CoverageEstimator:  # pylint: disable=too-many-instance-attributes
+    """Incremental voxel-occupancy estimate of the object surface seen so far
+
+    Points are expressed in an object-fixed frame, centered on the turntable axis
+    with the z-axis pointing up along it, and rotated back by the turntable angle of
+    the view they were captured from. The turntable angle of each view is measured
+    from the Aruco markers shared with the previous view, falling back to the
+    commanded motor angle when too few markers are shared.
+
+    Each voxel is unknown, free (a camera ray has passed through it) or occupied.
+    Occupied voxels next to unknown space are frontier voxels, where the surface
+    most likely continues into space that has not been observed yet.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        center: np.ndarray,
+        up: np.ndarray,
+        radius: float,
+        voxel_size: float = 2.0,
+        min_height: float = 5.0,
+        max_height: Optional[float] = None,
+        stride: int = 4,
+    ) -> None:
+        """Set up an empty coverage estimate
+
+        Arguments:
+            center:     Array (3) giving a point on the turntable axis (camera frame)
+            up:         Array (3) giving the turntable axis, pointing to the camera side
+            radius:     Points further than this from the axis are ignored
+            voxel_size: Size of occupancy voxels
+            min_height: Points closer than this to the turntable plane are ignored
+            max_height: Points further than this from the turntable plane are
+                        ignored (default: twice the radius)
+            stride:     Pixel stride used when subsampling the point cloud
+        """
+        wvec = up / np.linalg.norm(up)
+        uvec = np.array([1.0, 0.0, 0.0])
+        uvec = uvec - wvec * np.dot(uvec, wvec)
+        uvec = uvec / np.linalg.norm(uvec)
+        vvec = np.cross(wvec, uvec)
+
+        self.center = center
+        self.basis = np.vstack((uvec, vvec, wvec))
+        self.radius = radius
+        self.voxel_size = voxel_size
+        self.min_height = min_height
+        self.stride = stride
+
+        # Position of the camera (at the origin) relative to the turntable
+        self._camera_local = np.dot(self.basis, -center)
+
+        # Occupancy grid over the cylinder above the turntable
+        if max_height is None:
+            max_height = 2.0 * radius
+        self._grid_origin = np.array([-radius, -radius, min_height])
+        extent = np.array([2.0 * radius, 2.0 * radius, max_height - min_height])
+        shape = np.maximum(np.ceil(extent / voxel_size).astype(int), 1)
+        self._grid = np.full(tuple(shape), _UNKNOWN, dtype=np.int8)
+        n_ray_steps = int(np.ceil(np.linalg.norm(shape)))
+        self._ray_steps = (np.arange(n_ray_steps) + 1.5) * voxel_size
+
+        self._angle = 0.0
+        self._commanded_angle = 0.0
+        self._direction = 1.0
+        self._last_markers: Optional[Tuple[Dict[int, ArucoMarker], float]] = None
+
+    @classmethod
+    def from_point_cloud(
+        cls,
+        point_cloud: zivid.PointCloud,
+        voxel_size: float = 2.0,
+        min_height: float = 5.0,
+    ) -> "CoverageEstimator":
+        """Set up an empty coverage estimate from the turntable markers in a view
+
+        The turntable axis is taken through the mean of the marker centers, normal
+        to the plane fitted through them.
+
+        Arguments:
+            point_cloud:    A Zivid point cloud showing the turntable markers
+            voxel_size:     Size of occupancy voxels
+            min_height:     Points closer than this to the turntable plane are ignored
+        Returns:
+            A CoverageEstimator instance
+        """
+        markers = find_aruco_markers(point_cloud)
+        min_markers = 3
+        if len(markers) < min_markers:
+            raise RuntimeError(
+                f"Found only {len(markers)} well resolved markers. "
+                f"At least {min_markers} is required to locate the turntable."
+            )
+        points = np.array([val.center3d for val in markers.values()])
+        unit_normal, _, point_in_plane = plane_fit_svd(points)
+
+        # Camera sits at the origin, so "up" is the normal pointing towards it
+        up = -unit_normal if np.dot(unit_normal, point_in_plane) > 0 else unit_normal
+        radius = float(np.max(np.linalg.norm(points - point_in_plane, axis=1)))
+        return cls(point_in_plane, up, radius, voxel_size, min_height)
+
+    @property
+    def n_voxels(self) -> int:
+        """Number of occupied voxels observed so far"""
+        return int(np.sum(self._grid == _OCCUPIED))
+
+    @property
+    def angle(self) -> float:
+        """Measured turntable angle of the last view added, in degrees
+
+        Given relative to the first view, in the same direction as the commanded
+        motor angle.
+        """
+        return self._direction * self._angle
+
+    def predict_angle(self, commanded_angle: float) -> float:
+        """Predict turntable angle of a view from the commanded motor angle
+
+        Arguments:
+            commanded_angle:    Commanded motor angle in degrees
+        Returns:
+            Predicted turntable angle in degrees
+        """
+        commanded_rotation = commanded_angle - self._commanded_angle
+        return self._angle + self._direction * commanded_rotation
+
+    def _measure_rotation(
+        self, markers_a: Dict[int, ArucoMarker], markers_b: Dict[int, ArucoMarker]
+    ) -> Optional[float]:
+        """Measure turntable rotation between two views from their shared markers
+
+        Arguments:
+            markers_a:  Markers detected in the first view
+            markers_b:  Markers detected in the second view
+        Returns:
+            Rotation in degrees, or None if too few markers are shared
+        """
+        common_ids = set(markers_a.keys()) & set(markers_b.keys())
+        if len(common_ids) < 2:
+            return None
+        deltas = []
+        for idnum in common_ids:
+            local_a = np.dot(self.basis, markers_a[idnum].center3d - self.center)
+            local_b = np.dot(self.basis, markers_b[idnum].center3d - self.center)
+            azimuth_a = np.degrees(np.arctan2(local_a[1], local_a[0]))
+            azimuth_b = np.degrees(np.arctan2(local_b[1], local_b[0]))
+            deltas.append(_wrap_degrees(azimuth_b - azimuth_a))
+        return float(np.median(deltas))
+
+    def _camera_position(self, angle: float) -> np.ndarray:
+        """Get camera position in the object-fixed frame
+
+        Arguments:
+            angle:  Turntable angle of the view in degrees
+        Returns:
+            Array (3) giving the camera position
+        """
+        return np.dot(_rotation_matrix(angle), self._camera_local)
+
+    def _to_object_frame(
+        self, point_cloud: zivid.PointCloud, angle: float
+    ) -> np.ndarray:
+        """Get the points of a view in the object-fixed frame
+
+        Arguments:
+            point_cloud:    A Zivid point cloud
+            angle:          Turntable angle of the view in degrees
+        Returns:
+            Array (nx3) of all valid (subsampled) points, in the object-fixed frame
+        """
+        xyz = point_cloud.copy_data("xyz")[:: self.stride, :: self.stride, :]
+        xyz = xyz.reshape(-1, 3)
+        xyz = xyz[~np.isnan(xyz[:, 2])]
+        local = np.dot(xyz - self.center[np.newaxis, :], self.basis.T)
+        return np.dot(local, _rotation_matrix(angle).T)
+
+    def _to_indices(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Get voxel indices of points in the object-fixed frame
+
+        Arguments:
+            points: Array (...x3) of points
+        Returns:
+            Array (...x3) of voxel indices
+            Array (...) which is True where the index is inside the grid
+        """
+        indices = np.floor((points - self._grid_origin) / self.voxel_size).astype(int)
+        inside = np.all((indices >= 0) & (indices < self._grid.shape), axis=-1)
+        return indices, inside
+
+    def _sample_rays(
+        self, starts: np.ndarray, targets: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Sample voxels along rays from start points towards target points
+
+        Sampling starts one and a half voxel away from each start point, so that
+        the voxel of the start point itself is skipped.
+
+        Arguments:
+            starts:     Array (nx3) of ray start points
+            targets:    Array (nx3) or (3) of points the rays point towards
+        Returns:
+            Array (nxkx3) of voxel indices along each ray
+            Array (nxk) which is True where the index is inside the grid
+        """
+        directions = targets - starts
+        directions = directions / np.linalg.norm(directions, axis=-1, keepdims=True)
+        samples = (
+            starts[:, np.newaxis, :]
+            + directions[:, np.newaxis, :] * self._ray_steps[np.newaxis, :, np.newaxis]
+        )
+        return self._to_indices(samples)
+
+    def add_view(
+        self,
+        point_cloud: zivid.PointCloud,
+        commanded_angle: float,
+        max_rays: int = 5000,
+    ) -> float:
+        """Add a captured view to the coverage estimate
+
+        Arguments:
+            point_cloud:        A Zivid point cloud
+            commanded_angle:    Commanded motor angle of the view in degrees
+            max_rays:           Maximum number of camera rays used to carve free space
+        Returns:
+            Marginal gain, i.e. fraction of the occupied voxels seen in this view
+            that had not been seen before
+        """
+
+        # Find turntable angle of this view
+        angle = self.predict_angle(commanded_angle)
+        markers = find_aruco_markers(point_cloud)
+        if self._last_markers is not None:
+            prev_markers, prev_angle = self._last_markers
+            rotation = self._measure_rotation(prev_markers, markers)
+            if rotation is not None:
+                commanded_rotation = angle - prev_angle
+                if rotation * commanded_rotation < 0:
+                    self._direction = -self._direction
+                angle = prev_angle + rotation
+        if len(markers) >= 2:
+            self._last_markers = (markers, angle)
+        self._angle = angle
+        self._commanded_angle = commanded_angle
+
+        # Mark voxels containing object points as occupied
+        points = self._to_object_frame(point_cloud, angle)
+        object_points = points[np.hypot(points[:, 0], points[:, 1]) < self.radius]
+        indices, inside = self._to_indices(object_points)
+        indices = np.unique(indices[inside], axis=0)
+        n_new = int(np.sum(self._grid[tuple(indices.T)] != _OCCUPIED))
+        self._grid[tuple(indices.T)] = _OCCUPIED
+
+        # Mark unknown voxels between the camera and every observed point as free
+        self._carve_free_space(
+            points[:: max(1, len(points) // max_rays)], self._camera_position(angle)
+        )
+
+        return n_new / max(len(indices), 1)
+
+    def _carve_free_space(self, points: np.ndarray, camera: np.ndarray) -> None:
+        """Mark unknown voxels between the camera and observed points as free
+
+        Arguments:
+            points: Array (nx3) of observed points in the object-fixed frame
+            camera: Array (3) giving the camera position in the object-fixed frame
+        """
+        indices, inside = self._sample_rays(points, camera)
+        indices = indices[inside]
+        unknown = self._grid[tuple(indices.T)] == _UNKNOWN
+        self._grid[tuple(indices[unknown].T)] = _FREE
+
+    def _frontier(self, max_voxels: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Find occupied voxels next to unknown space
+
+        Voxels with unknown space on opposite sides, and thus no net direction
+        towards it, are left out.
+
+        Arguments:
+            max_voxels: Maximum number of frontier voxels to return (subsampled)
+        Returns:
+            Array (nx3) of frontier voxel centers
+            Array (nx3) of unit directions from each voxel towards unknown space
+        """
+        occupied = self._grid == _OCCUPIED
+        unknown = np.pad(self._grid == _UNKNOWN, 1, mode="constant")
+        open_directions = np.zeros(self._grid.shape + (3,), dtype=np.int8)
+        for axis in range(3):
+            for sign in (-1, 1):
+                slices = [slice(1, -1)] * 3
+                slices[axis] = slice(1 + sign, unknown.shape[axis] - 1 + sign)
+                if sign > 0:
+                    open_directions[..., axis] += unknown[tuple(slices)]
+                else:
+                    open_directions[..., axis] -= unknown[tuple(slices)]
+        is_frontier = occupied & np.any(open_directions != 0, axis=-1)
+
+        indices = np.argwhere(is_frontier)
+        indices = indices[:: max(1, len(indices) // max_voxels)]
+        centers = self._grid_origin + (indices + 0.5) * self.voxel_size
+        directions = open_directions[tuple(indices.T)]
+        directions = directions / np.linalg.norm(directions, axis=-1, keepdims=True)
+        return centers, directions
+
+    def _visible_frontier(
+        self,
+        centers: np.ndarray,
+        directions: np.ndarray,
+        angle: float,
+        max_incidence_degrees: float,
+    ) -> np.ndarray:
+        """Check which frontier voxels a view would look into unknown space at
+
+        Arguments:
+            centers:                Array (nx3) of frontier voxel centers
+            directions:             Array (nx3) of directions towards unknown space
+            angle:                  Turntable angle of the view in degrees
+            max_incidence_degrees:  Largest angle between the direction towards
+                                    unknown space and the direction to the camera
+        Returns:
+            Array (n) which is True for voxels that face the camera unoccluded
+        """
+        camera = self._camera_position(angle)
+        to_camera = camera[np.newaxis, :] - centers
+        to_camera = to_camera / np.linalg.norm(to_camera, axis=-1, keepdims=True)
+        facing = np.sum(directions * to_camera, axis=-1) > np.cos(
+            np.radians(max_incidence_degrees)
+        )
+        indices, inside = self._sample_rays(centers[facing], camera)
+        occluded = np.zeros(inside.shape, dtype=bool)
+        occluded[inside] = self._grid[tuple(indices[inside].T)] == _OCCUPIED
+        visible = np.zeros(len(centers), dtype=bool)
+        visible[facing] = ~np.any(occluded, axis=-1)
+        return visible
+
+    def choose_next_view(
+        self,
+        candidate_angles: Sequence[float],
+        keep_fraction: float = 0.9,
+        max_incidence_degrees: float = 75.0,
+        max_frontier: int = 2000,
+    ) -> int:
+        """Choose the largest rotation that does not skip past frontier voxels
+
+        A frontier voxel may only be visible within a window of rotations, e.g. in
+        a concavity that becomes occluded again. The chosen candidate is the last
+        one that still sees at least keep_fraction of the frontier voxels that any
+        smaller candidate would see, so rotations stay small for complex objects
+        and large for simple ones.
+
+        Arguments:
+            candidate_angles:       Turntable angles of the candidates, in the
+                                    order of increasing rotation
+            keep_fraction:          Fraction of frontier voxels that must be kept
+            max_incidence_degrees:  Largest angle between the direction towards
+                                    unknown space and the direction to the camera
+            max_frontier:           Maximum number of frontier voxels to evaluate
+        Returns:
+            Index of the chosen candidate
+        """
+        centers, directions = self._frontier(max_frontier)
+        if len(centers) == 0:
+            return len(candidate_angles) - 1
+        visible = np.array(
+            [
+                self._visible_frontier(
+                    centers, directions, angle, max_incidence_degrees
+                )
+                for angle in candidate_angles
+            ]
+        )
+        n_reachable = np.sum(np.logical_or.accumulate(visible, axis=0), axis=1)
+        n_visible = np.sum(visible, axis=1)
+        keeps_frontier = n_visible >= keep_fraction * n_reachable
+        return int(np.nonzero(keeps_frontier)[0][-1])
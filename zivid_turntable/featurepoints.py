@@ -1,7 +1,7 @@
 """Module for detecting feature points"""
 
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, List, Tuple
 
 import cv2
 import numpy as np
@@ -52,6 +52,27 @@ def _point2d_to_point3d(point_cloud: zivid.PointCloud, point2d: np.ndarray) -> s
     return xyz[idx[1], idx[0], :]
 
 
+def _detect_markers(
+    grayscale: np.ndarray, equalize_histogram: bool = False
+) -> Tuple[List[np.ndarray], np.ndarray]:
+    """Detect Aruco markers in a grayscale image
+
+    Arguments:
+        grayscale:          Array (hxw) of grayscale image
+        equalize_histogram: Equalize histogram before detecting markers
+    Returns:
+        List of arrays (1x4x2) of 2D corner points
+        Array (n) of marker IDs
+    """
+    if equalize_histogram:
+        grayscale = cv2.equalizeHist(grayscale)
+    aruco_dict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_4X4_100)
+    res = cv2.aruco.detectMarkers(grayscale, aruco_dict)
+    if res[1] is None:
+        return [], np.zeros(0, dtype=int)
+    return res[0], res[1].flatten()
+
+
 def find_aruco_markers(
     point_cloud: zivid.PointCloud, equalize_histogram: bool = False
 ) -> Dict[int, ArucoMarker]:
@@ -66,12 +87,7 @@ def find_aruco_markers(
     # Use OpenCV to find Aruco markers
     rgba = point_cloud.copy_data("rgba")
     grayscale = cv2.cvtColor(rgba, cv2.COLOR_RGB2GRAY)
-    if equalize_histogram:
-        grayscale = cv2.equalizeHist(grayscale)
-    aruco_dict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_4X4_100)
-    res = cv2.aruco.detectMarkers(grayscale, aruco_dict)
-    coords = res[0]
-    idnums = res[1].flatten()
+    coords, idnums = _detect_markers(grayscale, equalize_histogram)
 
     # Construct an ArucoMarker object for each detected marker
     markers = {}
@@ -88,3 +104,34 @@ def find_aruco_markers(
             print(f"Skipping marker due to exception: {str(ex)}")
 
     return markers
+
+
+def make_thumbnail(point_cloud: zivid.PointCloud, scale: float = 0.5) -> np.ndarray:
+    """Make a downscaled grayscale image of a point cloud
+
+    Arguments:
+        point_cloud:    A Zivid point cloud
+        scale:          Factor to downscale the color image with
+    Returns:
+        Array (hxw) of grayscale image
+    """
+    rgba = point_cloud.copy_data("rgba")
+    grayscale = cv2.cvtColor(rgba, cv2.COLOR_RGB2GRAY)
+    return cv2.resize(grayscale, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+def find_aruco_markers_2d(
+    grayscale: np.ndarray, equalize_histogram: bool = False
+) -> Dict[int, np.ndarray]:
+    """Quickly find Aruco markers in a (thumbnail) image, without 3D points
+
+    Arguments:
+        grayscale:          Array (hxw) of grayscale image
+        equalize_histogram: Equalize histogram before detecting markers
+    Returns:
+        Dictionary of {id: Array (2) of 2D center point in the image}
+    """
+    coords, idnums = _detect_markers(grayscale, equalize_histogram)
+    return {
+        int(idnum): coord[0, :, :].mean(axis=0) for coord, idnum in zip(coords, idnums)
+    }
@@ -1,6 +1,19 @@
 """Module for input/output"""
 
+import json
+import re
+import threading
+from dataclasses import dataclass
 from pathlib import Path
+from queue import Empty, Queue
+from typing import Dict, Iterator, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+import zivid
+
+ANGLES_FILENAME = "angles.json"
+FRAME_FILENAME_PATTERN = re.compile(r"frame_(\d+)\.zdf$")
 
 
 def make_casedir_name(label: str) -> str:
@@ -29,3 +42,161 @@ def create_casedir(label: str, workdir: Path) -> Path:
     dirpath.mkdir()
     print(f"Created case directory: {dirpath}")
     return dirpath
+
+
+def write_frame_angles(dirpath: Path, angles: Dict[str, float]) -> Path:
+    """Write turntable angle of each captured frame to case directory
+
+    Arguments:
+        dirpath:    Path to case directory
+        angles:     Dictionary of {frame filename: angle in degrees}
+    Returns:
+        Path to the written angles file
+    """
+    filepath = dirpath / ANGLES_FILENAME
+    with open(filepath, "w", encoding="utf-8") as file:
+        json.dump(angles, file, indent=4, sort_keys=True)
+    return filepath
+
+
+def thumbnail_path(frame_path: Path) -> Path:
+    """Get path of the thumbnail image stored next to a frame
+
+    Arguments:
+        frame_path: Path to frame file
+    Returns:
+        Path to thumbnail image
+    """
+    return frame_path.with_suffix(".png")
+
+
+def write_thumbnail(frame_path: Path, thumbnail: np.ndarray) -> None:
+    """Write thumbnail image next to a frame
+
+    Arguments:
+        frame_path: Path to frame file
+        thumbnail:  Array (hxw) of grayscale image
+    """
+    cv2.imwrite(str(thumbnail_path(frame_path)), thumbnail)
+
+
+def read_thumbnail(frame_path: Path) -> Optional[np.ndarray]:
+    """Read thumbnail image stored next to a frame
+
+    Arguments:
+        frame_path: Path to frame file
+    Returns:
+        Array (hxw) of grayscale image, or None if there is no thumbnail
+    """
+    filepath = thumbnail_path(frame_path)
+    if not filepath.is_file():
+        return None
+    return cv2.imread(str(filepath), cv2.IMREAD_GRAYSCALE)
+
+
+@dataclass
+class FrameInfo:
+    """Class for representing a frame file in a case directory"""
+
+    index: int
+    path: Path
+    size_bytes: int
+
+
+class FrameSource:
+    """Lazy access to the frames of a case directory, in order of frame index
+
+    Frame indices and file info are available without reading any frames. When
+    iterating, upcoming frames are read in a background thread while the current
+    one is processed.
+    """
+
+    def __init__(self, dirpath: Path, read_ahead: int = 1) -> None:
+        """Find frames in case directory
+
+        Arguments:
+            dirpath:    Path to case directory
+            read_ahead: Number of frames to queue ahead of the one being processed.
+                        The reader may hold one more frame while waiting for the
+                        queue, so up to read_ahead + 1 frames are in memory
+                        besides the one being processed.
+        """
+        infos = []
+        for filepath in dirpath.glob("*.zdf"):
+            match = FRAME_FILENAME_PATTERN.match(filepath.name)
+            if match is None:
+                print(f"Skipping file not named like a frame: {filepath}")
+                continue
+            infos.append(
+                FrameInfo(
+                    index=int(match.group(1)),
+                    path=filepath,
+                    size_bytes=filepath.stat().st_size,
+                )
+            )
+        self.infos = sorted(infos, key=lambda info: info.index)
+        self.read_ahead = read_ahead
+
+    def __len__(self) -> int:
+        return len(self.infos)
+
+    def frames(
+        self, indices: Optional[Sequence[int]] = None
+    ) -> Iterator[Tuple[FrameInfo, zivid.Frame]]:
+        """Iterate over frames in order, reading ahead in a background thread
+
+        The caller owns each yielded frame and should release it when done.
+
+        Arguments:
+            indices:    Frame indices to read (default: all frames)
+        Returns:
+            Iterator of (FrameInfo, Zivid frame)
+        """
+        infos = [
+            info for info in self.infos if indices is None or info.index in indices
+        ]
+        queue: "Queue[Union[Tuple[FrameInfo, zivid.Frame], Exception, None]]" = Queue(
+            maxsize=max(self.read_ahead, 1)
+        )
+        stop = threading.Event()
+
+        def _read_frames() -> None:
+            for info in infos:
+                if stop.is_set():
+                    return
+                try:
+                    queue.put((info, zivid.Frame(info.path)))
+                except Exception as ex:  # pylint: disable=broad-except
+                    queue.put(ex)
+                    return
+            queue.put(None)
+
+        reader = threading.Thread(target=_read_frames, daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Unblock and stop the reader if iteration ended early
+            stop.set()
+            while reader.is_alive():
+                try:
+                    item = queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                if isinstance(item, tuple):
+                    item[1].release()
+
+            # Release frames queued just before the reader stopped
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except Empty:
+                    break
+                if isinstance(item, tuple):
+                    item[1].release()
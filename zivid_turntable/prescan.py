@@ -0,0 +1,133 @@
+"""Module for quickly validating a case before processing it"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .calibration import plan_registration
+from .featurepoints import find_aruco_markers_2d, make_thumbnail
+from .io import FrameSource, read_thumbnail
+
+
+@dataclass
+class FrameCheck:
+    """Class for representing the pre-scan result of a single frame"""
+
+    index: int
+    n_markers: int
+    common_prev: int
+    common_next: int
+    reference: Optional[int]
+    pose_quality: float
+    keep: bool
+
+
+def _pose_quality(centers: np.ndarray, image_diagonal: float, min_common: int) -> float:
+    """Estimate how well a set of markers constrains a pose
+
+    Arguments:
+        centers:        Array (nx2) of 2D marker centers
+        image_diagonal: Length of image diagonal in pixels
+        min_common:     Minimum number of markers needed for registration
+    Returns:
+        Score from 0 (unconstrained) to 1 (many markers spread across the image)
+    """
+    if len(centers) < 3:
+        return 0.0
+    spread = np.sqrt(max(np.linalg.eigvalsh(np.cov(centers.T))[0], 0.0))
+    count_score = min(1.0, len(centers) / (2.0 * min_common))
+    spread_score = min(1.0, spread / (0.1 * image_diagonal))
+    return float(count_score * spread_score)
+
+
+def prescan(  # pylint: disable=too-many-locals
+    frame_source: FrameSource,
+    scale: float = 0.5,
+    equalize_histogram: bool = False,
+    min_markers: int = 4,
+    min_common: int = 3,
+) -> List[FrameCheck]:
+    """Check marker detection in every frame of a case, on thumbnails only
+
+    Thumbnails are stored next to the frames during capture. Frames without one
+    are read in full to make it, which is as slow as reading them for processing.
+
+    The result is only an estimate. Small or distant markers may be found at full
+    resolution but not in the thumbnail, so frames should not be excluded from
+    processing based on it alone.
+
+    Arguments:
+        frame_source:       Frames of the case
+        scale:              Factor to downscale with when a thumbnail is missing
+        equalize_histogram: Equalize histogram when detecting markers
+        min_markers:        Minimum number of markers in a kept frame
+        min_common:         Minimum number of markers shared with the reference frame
+    Returns:
+        List of FrameCheck, one for each frame
+    """
+    n_frames = len(frame_source)
+    frame_indices = [info.index for info in frame_source.infos]
+    marker_centers: List[Dict[int, np.ndarray]] = [{} for _ in range(n_frames)]
+    image_diagonals = np.ones(n_frames)
+
+    # Detect markers in 2D only, on stored thumbnails where available
+    missing = []
+    for i, info in enumerate(frame_source.infos):
+        thumbnail = read_thumbnail(info.path)
+        if thumbnail is None:
+            missing.append(info.index)
+            continue
+        marker_centers[i] = find_aruco_markers_2d(thumbnail, equalize_histogram)
+        image_diagonals[i] = np.hypot(*thumbnail.shape)
+    if missing:
+        print(f"No thumbnail for {len(missing)} frames, reading them in full")
+        for info, frame in frame_source.frames(missing):
+            thumbnail = make_thumbnail(frame.point_cloud(), scale)
+            frame.release()
+            i = frame_indices.index(info.index)
+            marker_centers[i] = find_aruco_markers_2d(thumbnail, equalize_histogram)
+            image_diagonals[i] = np.hypot(*thumbnail.shape)
+
+    # Estimate which frames will be kept, and what they will be registered to
+    marker_ids = [set(centers.keys()) for centers in marker_centers]
+    plan = plan_registration(
+        marker_ids, min_markers, min_common, frame_indices, verbose=False
+    )
+
+    checks = []
+    for i, (info, ids) in enumerate(zip(frame_source.infos, marker_ids)):
+        reference = plan.get(i)
+        if reference is None:
+            common_ids = ids
+        else:
+            common_ids = ids & marker_ids[reference]
+        centers = np.array([marker_centers[i][idnum] for idnum in common_ids])
+        common_prev = len(ids & marker_ids[i - 1]) if i > 0 else 0
+        common_next = len(ids & marker_ids[i + 1]) if i + 1 < len(marker_ids) else 0
+        reference_index = None
+        if reference is not None:
+            reference_index = frame_indices[reference]
+        checks.append(
+            FrameCheck(
+                index=info.index,
+                n_markers=len(ids),
+                common_prev=common_prev,
+                common_next=common_next,
+                reference=reference_index,
+                pose_quality=_pose_quality(centers, image_diagonals[i], min_common),
+                keep=i in plan,
+            )
+        )
+
+    print("Pre-scan results:")
+    print("frame  markers  prev  next  reference  quality  keep")
+    for check in checks:
+        reference_str = "-" if check.reference is None else str(check.reference)
+        print(
+            f"{check.index:5d}  {check.n_markers:7d}  {check.common_prev:4d}  "
+            f"{check.common_next:4d}  {reference_str:>9s}  "
+            f"{check.pose_quality:7.2f}  {str(check.keep):>4s}"
+        )
+
+    return checks
@@ -0,0 +1,238 @@
+"""Module for refining alignment between point clouds with ICP"""
+
+import multiprocessing
+import os
+import time
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+import open3d as o3d
+
+
+def _to_open3d_pointcloud(xyz: np.ndarray) -> o3d.geometry.PointCloud:
+    """Convert array of points to Open3D point cloud
+
+    Arguments:
+        xyz:    Array (nx3) of points
+    Returns:
+        An Open3D point cloud
+    """
+    pcd = o3d.geometry.PointCloud()
+    pcd.points = o3d.utility.Vector3dVector(xyz)
+    return pcd
+
+
+def multiscale_icp(
+    source_xyz: np.ndarray,
+    target_xyz: np.ndarray,
+    voxel_sizes: Sequence[float],
+    max_iterations: Sequence[int],
+    min_fitness: float,
+) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Point-to-plane ICP on a voxel pyramid, from coarse to fine
+
+    ICP at each level stops early once fitness and RMSE stop improving, and the
+    result of each level initializes the next.
+
+    Arguments:
+        source_xyz:     Array (nx3) of points to align
+        target_xyz:     Array (mx3) of points to align to
+        voxel_sizes:    Voxel size of each pyramid level, coarse to fine
+        max_iterations: Maximum number of ICP iterations at each level
+        min_fitness:    Minimum fraction of source points with a correspondence
+    Returns:
+        Array (4x4) transforming source onto target
+        Array (6x6) information matrix of the transform
+        or None if the point clouds do not overlap well enough
+    """
+    source = _to_open3d_pointcloud(source_xyz)
+    target = _to_open3d_pointcloud(target_xyz)
+
+    transform = np.eye(4)
+    for voxel_size, max_iteration in zip(voxel_sizes, max_iterations):
+        source_down = source.voxel_down_sample(voxel_size)
+        target_down = target.voxel_down_sample(voxel_size)
+        target_down.estimate_normals(
+            o3d.geometry.KDTreeSearchParamHybrid(radius=2.0 * voxel_size, max_nn=30)
+        )
+        result = o3d.pipelines.registration.registration_icp(
+            source_down,
+            target_down,
+            2.0 * voxel_size,
+            transform,
+            o3d.pipelines.registration.TransformationEstimationPointToPlane(),
+            o3d.pipelines.registration.ICPConvergenceCriteria(
+                relative_fitness=1e-6, relative_rmse=1e-6, max_iteration=max_iteration
+            ),
+        )
+        if result.fitness < min_fitness:
+            return None
+        transform = result.transformation
+
+    information = o3d.pipelines.registration.get_information_matrix_from_point_clouds(
+        source_down, target_down, 2.0 * voxel_sizes[-1], transform
+    )
+    return transform, information
+
+
+def _identity_information(
+    source_xyz: np.ndarray, target_xyz: np.ndarray, voxel_size: float
+) -> np.ndarray:
+    """Get information matrix of keeping two point clouds as they are
+
+    This weights an edge for the existing alignment like an edge found by ICP, so
+    that it is not bent by the residuals of the other edges.
+
+    Arguments:
+        source_xyz: Array (nx3) of source points
+        target_xyz: Array (mx3) of target points
+        voxel_size: Voxel size to downsample with
+    Returns:
+        Array (6x6) information matrix of the identity transform
+    """
+    source = _to_open3d_pointcloud(source_xyz).voxel_down_sample(voxel_size)
+    target = _to_open3d_pointcloud(target_xyz).voxel_down_sample(voxel_size)
+    return o3d.pipelines.registration.get_information_matrix_from_point_clouds(
+        source, target, 2.0 * voxel_size, np.eye(4)
+    )
+
+
+def _get_by_deadline(job: Any, deadline: float) -> Any:
+    """Get result of a pool job, waiting no longer than a deadline
+
+    Arguments:
+        job:        Result handle returned by Pool.apply_async
+        deadline:   Deadline, as returned by time.monotonic()
+    Returns:
+        Result of the job, or None if it did not finish before the deadline
+    """
+    try:
+        return job.get(timeout=max(0.0, deadline - time.monotonic()))
+    except multiprocessing.TimeoutError:
+        return None
+
+
+def refine_alignment(  # pylint: disable=too-many-arguments,too-many-locals
+    point_clouds: List[o3d.geometry.PointCloud],
+    voxel_sizes: Sequence[float] = (4.0, 2.0, 1.0),
+    max_iterations: Sequence[int] = (30, 20, 10),
+    min_fitness: float = 0.3,
+    seconds_per_view: float = 5.0,
+    n_workers: Optional[int] = None,
+) -> List[np.ndarray]:
+    """Refine alignment of point clouds that are already roughly aligned
+
+    Neighboring views, and the last and first view as a loop closure, are
+    registered pairwise in parallel. The pairwise results are merged into a
+    consistent set of poses by pose graph optimization. Pairs that do not finish
+    within the time budget, or that do not overlap well enough, fall back to the
+    existing alignment, weighted by the correspondences at that alignment. All of
+    this runs in the worker pool, so the time budget bounds the whole refinement
+    apart from the final pose graph optimization.
+
+    Arguments:
+        point_clouds:       List of Open3D point clouds in the same frame
+        voxel_sizes:        Voxel size of each pyramid level, coarse to fine
+        max_iterations:     Maximum number of ICP iterations at each level
+        min_fitness:        Minimum fraction of points with a correspondence
+        seconds_per_view:   Time budget for pairwise registration per view
+        n_workers:          Number of worker processes (default: number of cores)
+    Returns:
+        List of 4x4 corrections to apply to each point cloud
+    """
+    n_views = len(point_clouds)
+    if n_views < 2:
+        return [np.eye(4) for _ in point_clouds]
+
+    pairs = [(i, i + 1) for i in range(n_views - 1)]
+    if n_views > 2:
+        pairs.append((0, n_views - 1))
+
+    # Register pairs in parallel. Spawn rather than fork, since forking after
+    # Open3D has started its OpenMP threads may deadlock the workers.
+    xyz_arrays = [np.asarray(pcd.points) for pcd in point_clouds]
+    deadline = time.monotonic() + seconds_per_view * n_views
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(n_workers or os.cpu_count()) as pool:
+        # Information of keeping the existing alignment of neighboring views, as
+        # fallback for failed pairs. Submitted first, since these are quick.
+        fallback_jobs = [
+            pool.apply_async(
+                _identity_information,
+                (xyz_arrays[source_id], xyz_arrays[target_id], voxel_sizes[-1]),
+            )
+            for source_id, target_id in pairs[: n_views - 1]
+        ]
+        jobs = [
+            pool.apply_async(
+                multiscale_icp,
+                (
+                    xyz_arrays[source_id],
+                    xyz_arrays[target_id],
+                    voxel_sizes,
+                    max_iterations,
+                    min_fitness,
+                ),
+            )
+            for source_id, target_id in pairs
+        ]
+        fallbacks: List[Optional[np.ndarray]] = [
+            _get_by_deadline(job, deadline) for job in fallback_jobs
+        ]
+        results = []
+        for (source_id, target_id), job in zip(pairs, jobs):
+            result = _get_by_deadline(job, deadline)
+            if not job.ready():
+                print(f"ICP {source_id}-{target_id}: exceeded time budget")
+            if result is not None:
+                print(f"ICP {source_id}-{target_id}: correction\n{result[0]}")
+            else:
+                print(f"ICP {source_id}-{target_id}: keeping marker-based alignment")
+            results.append(result)
+
+    # Pairs without any information in time are weighted like the average pair
+    informations = [pair[1] for pair in results if pair is not None]
+    informations += [fallback for fallback in fallbacks if fallback is not None]
+    if not informations:
+        print("No pair finished within the time budget, keeping marker-based alignment")
+        return [np.eye(4) for _ in point_clouds]
+    mean_information = np.mean(informations, axis=0)
+
+    # Merge pairwise results into a pose graph
+    pose_graph = o3d.pipelines.registration.PoseGraph()
+    odometry = np.eye(4)
+    pose_graph.nodes.append(o3d.pipelines.registration.PoseGraphNode(odometry))
+    for (source_id, target_id), result in zip(pairs, results):
+        is_loop_closure = target_id != source_id + 1
+        if result is None:
+            if is_loop_closure:
+                continue
+            fallback = fallbacks[source_id]
+            result = (np.eye(4), mean_information if fallback is None else fallback)
+        transform, information = result
+        if not is_loop_closure:
+            odometry = np.dot(transform, odometry)
+            pose_graph.nodes.append(
+                o3d.pipelines.registration.PoseGraphNode(np.linalg.inv(odometry))
+            )
+        pose_graph.edges.append(
+            o3d.pipelines.registration.PoseGraphEdge(
+                source_id,
+                target_id,
+                transform,
+                information,
+                uncertain=is_loop_closure,
+            )
+        )
+
+    o3d.pipelines.registration.global_optimization(
+        pose_graph,
+        o3d.pipelines.registration.GlobalOptimizationLevenbergMarquardt(),
+        o3d.pipelines.registration.GlobalOptimizationConvergenceCriteria(),
+        o3d.pipelines.registration.GlobalOptimizationOption(
+            max_correspondence_distance=2.0 * voxel_sizes[-1],
+            edge_prune_threshold=0.25,
+            reference_node=0,
+        ),
+    )
+    return [np.array(node.pose) for node in pose_graph.nodes]